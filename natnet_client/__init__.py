@@ -2,5 +2,6 @@ from .data_descriptions import *
 from .data_frame import *
 from .event import Event
 from .nat_net_client import NatNetClient
+from .protocol_flags import ProtocolFlags
 from .server_info import *
 from .version import *
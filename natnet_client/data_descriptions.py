@@ -1,23 +1,37 @@
+import logging
+import struct
 from typing import NamedTuple, Tuple, Optional
 
 from .data_types import Vec3, Vec4
 from .packet_buffer import PacketBuffer
 from .packet_component import PacketComponent, PacketComponentArray
-from .version import Version
+from .protocol_flags import ProtocolFlags
+
+_logger = logging.getLogger(__name__)
+
+# Numeric part of a rigid body description: id, parent id, pos
+_RIGID_BODY_DESC_STRUCT = struct.Struct("<II3f")
+# Force plate description: width, length, origin
+_FORCE_PLATE_DIMENSIONS_STRUCT = struct.Struct("<5f")
+# Force plate description: plate type, channel data type, channel count / device description: device type, channel
+# data type, channel count
+_UINT32_TRIPLE_STRUCT = struct.Struct("<III")
+# Camera description: position, orientation
+_CAMERA_POSE_STRUCT = struct.Struct("<7f")
 
 
 class MarkerSetDescription(PacketComponent, NamedTuple(
     "MarkerSetDescriptionFields",
     (("name", str),
      ("marker_names", Tuple[str, ...])))):
+    __slots__ = ()
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "MarkerSetDescription":
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "MarkerSetDescription":
         name = buffer.read_string()
 
         marker_count = buffer.read_uint32()
-        marker_names = [buffer.read_string() for _ in range(marker_count)]
-        return MarkerSetDescription(name, tuple(marker_names))
+        return MarkerSetDescription(name, tuple(buffer.read_string() for _ in range(marker_count)))
 
 
 class RigidBodyMarkerDescription(PacketComponentArray, NamedTuple(
@@ -25,16 +39,17 @@ class RigidBodyMarkerDescription(PacketComponentArray, NamedTuple(
     (("name", Optional[str]),
      ("active_label", int),
      ("pos", Vec3)))):
+    __slots__ = ()
 
     @classmethod
     def read_array_from_buffer(cls, buffer: PacketBuffer,
-                               protocol_version: Version) -> "Tuple[RigidBodyMarkerDescription, ...]":
+                               protocol_flags: ProtocolFlags) -> "Tuple[RigidBodyMarkerDescription, ...]":
         marker_count = buffer.read_uint32()
-        pos = [buffer.read_float32_array(3) for _ in range(marker_count)]
-        active_labels = [buffer.read_uint32() for _ in range(marker_count)]
-        names = [buffer.read_string() for _ in range(marker_count)] if protocol_version >= Version(4) else \
+        pos = buffer.read_float32_matrix(marker_count, 3)
+        active_labels = buffer.read_uint32_array(marker_count)
+        names = [buffer.read_string() for _ in range(marker_count)] if protocol_flags.ge4 else \
             [None] * marker_count
-        return tuple(RigidBodyMarkerDescription(*a) for a in zip(names, active_labels, pos))
+        return tuple(map(RigidBodyMarkerDescription, names, active_labels, pos))
 
 
 class RigidBodyDescription(PacketComponent, NamedTuple(
@@ -44,23 +59,23 @@ class RigidBodyDescription(PacketComponent, NamedTuple(
      ("parent_id", int),
      ("pos", Vec3),
      ("markers", Tuple[RigidBodyMarkerDescription, ...])))):
+    __slots__ = ()
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "RigidBodyDescription":
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "RigidBodyDescription":
         # Version 2.0 or higher
-        name = buffer.read_string() if protocol_version >= Version(2) else None
+        name = buffer.read_string() if protocol_flags.ge2 else None
 
-        new_id = buffer.read_uint32()
-        parent_id = buffer.read_uint32()
-        pos = buffer.read_float32_array(3)
+        new_id, parent_id, x, y, z = buffer.read(_RIGID_BODY_DESC_STRUCT)
+        pos = (x, y, z)
 
         # Version 3.0 and higher, rigid body marker information contained in description
-        if protocol_version >= Version(3):
-            marker_descriptions = RigidBodyMarkerDescription.read_array_from_buffer(buffer, protocol_version)
+        if protocol_flags.ge3:
+            marker_descriptions = RigidBodyMarkerDescription.read_array_from_buffer(buffer, protocol_flags)
         else:
-            marker_descriptions = []
+            marker_descriptions = ()
 
-        return RigidBodyDescription(name, new_id, parent_id, pos, tuple(marker_descriptions))
+        return RigidBodyDescription(name, new_id, parent_id, pos, marker_descriptions)
 
 
 class SkeletonDescription(PacketComponent, NamedTuple(
@@ -68,18 +83,24 @@ class SkeletonDescription(PacketComponent, NamedTuple(
     (("name", str),
      ("id_num", int),
      ("rigid_body_descriptions", Tuple[RigidBodyDescription, ...])))):
+    __slots__ = ()
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "SkeletonDescription":
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "SkeletonDescription":
         name = buffer.read_string()
         new_id = buffer.read_uint32()
         rigid_body_count = buffer.read_uint32()
 
-        # Loop over all Rigid Bodies
-        rigid_body_descs = [
-            RigidBodyDescription.read_from_buffer(buffer, protocol_version)
-            for _ in range(rigid_body_count)]
-        return SkeletonDescription(name, new_id, tuple(rigid_body_descs))
+        if protocol_flags.ge2:
+            # Loop over all Rigid Bodies
+            read_rigid_body_desc = RigidBodyDescription.read_from_buffer
+            rigid_body_descs = tuple(read_rigid_body_desc(buffer, protocol_flags) for _ in range(rigid_body_count))
+        else:
+            # Without names and markers, all rigid body descriptions have the same layout and are read in one pass
+            rigid_body_descs = tuple(
+                RigidBodyDescription(None, rb_id, parent_id, (x, y, z), ())
+                for rb_id, parent_id, x, y, z in buffer.read_array(_RIGID_BODY_DESC_STRUCT, rigid_body_count))
+        return SkeletonDescription(name, new_id, rigid_body_descs)
 
 
 class ForcePlateDescription(PacketComponent, NamedTuple(
@@ -94,31 +115,28 @@ class ForcePlateDescription(PacketComponent, NamedTuple(
      ("plate_type", int),
      ("channel_data_type", int),
      ("channel_list", Tuple[str, ...])))):
+    __slots__ = ()
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> Optional["ForcePlateDescription"]:
-        if protocol_version >= Version(3):
+    def read_from_buffer(cls, buffer: PacketBuffer,
+                         protocol_flags: ProtocolFlags) -> Optional["ForcePlateDescription"]:
+        if protocol_flags.ge3:
             new_id = buffer.read_uint32()
             serial_number = buffer.read_string()
-            width = buffer.read_float32()
-            length = buffer.read_float32()
-            origin = buffer.read_float32_array(3)
+            dimensions = buffer.read(_FORCE_PLATE_DIMENSIONS_STRUCT)
+            width, length = dimensions[:2]
+            origin = dimensions[2:]
 
-            cal_matrix_flat = buffer.read_float32_array(12 * 12)
-            cal_matrix = [cal_matrix_flat[i * 12:(i + 1) * 12] for i in range(12)]
+            cal_matrix = buffer.read_float32_matrix(12, 12)
+            corners = buffer.read_float32_matrix(3, 3)
 
-            corners_flat = buffer.read_float32_array(3 * 3)
-            corners = [corners_flat[i * 3:(i + 1) * 3] for i in range(3)]
+            plate_type, channel_data_type, num_channels = buffer.read(_UINT32_TRIPLE_STRUCT)
 
-            plate_type = buffer.read_uint32()
-            channel_data_type = buffer.read_uint32()
-            num_channels = buffer.read_uint32()
-
-            channels = [buffer.read_string() for _ in range(num_channels)]
+            channels = tuple(buffer.read_string() for _ in range(num_channels))
 
             return ForcePlateDescription(
-                new_id, serial_number, width, length, origin, tuple(cal_matrix), tuple(corners), plate_type,
-                channel_data_type, tuple(channels))
+                new_id, serial_number, width, length, origin, cal_matrix, corners, plate_type,
+                channel_data_type, channels)
         else:
             return None
 
@@ -131,22 +149,20 @@ class DeviceDescription(PacketComponent, NamedTuple(
      ("device_type", int),
      ("channel_data_type", int),
      ("channel_names", Tuple[str, ...])))):
+    __slots__ = ()
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> Optional["DeviceDescription"]:
-        if protocol_version >= Version(3):
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> Optional["DeviceDescription"]:
+        if protocol_flags.ge3:
             new_id = buffer.read_uint32()
             name = buffer.read_string()
             serial_number = buffer.read_string()
-            device_type = buffer.read_uint32()
-            channel_data_type = buffer.read_uint32()
-            num_channels = buffer.read_uint32()
+            device_type, channel_data_type, num_channels = buffer.read(_UINT32_TRIPLE_STRUCT)
 
             # Channel Names list of NoC strings
-            channel_names = [buffer.read_string() for _ in range(num_channels)]
+            channel_names = tuple(buffer.read_string() for _ in range(num_channels))
 
-            return DeviceDescription(new_id, name, serial_number, device_type, channel_data_type,
-                                     tuple(channel_names))
+            return DeviceDescription(new_id, name, serial_number, device_type, channel_data_type, channel_names)
         else:
             return None
 
@@ -156,16 +172,23 @@ class CameraDescription(PacketComponent, NamedTuple(
     (("name", str),
      ("position", Vec3),
      ("orientation_quat", Vec4)))):
+    __slots__ = ()
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "CameraDescription":
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "CameraDescription":
         name = buffer.read_string()
-        position = buffer.read_float32_array(3)
-        orientation = buffer.read_float32_array(4)
+        pose = buffer.read(_CAMERA_POSE_STRUCT)
+        position = pose[:3]
+        orientation = pose[3:]
 
         return CameraDescription(name, position, orientation)
 
 
+# Description types in the order of their data type ids and of the DataDescriptions fields
+_DESC_TYPES = (MarkerSetDescription, RigidBodyDescription, SkeletonDescription, ForcePlateDescription,
+               DeviceDescription, CameraDescription)
+
+
 class DataDescriptions(PacketComponent, NamedTuple("DataDescriptions", (
         ("marker_sets", Tuple[MarkerSetDescription, ...]),
         ("rigid_bodies", Tuple[RigidBodyDescription, ...]),
@@ -173,27 +196,21 @@ class DataDescriptions(PacketComponent, NamedTuple("DataDescriptions", (
         ("force_plates", Tuple[ForcePlateDescription, ...]),
         ("devices", Tuple[DeviceDescription, ...]),
         ("cameras", Tuple[CameraDescription, ...])))):
+    __slots__ = ()
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "DataDescriptions":
-        data_desc_types = {
-            0: ("marker_sets", MarkerSetDescription),
-            1: ("rigid_bodies", RigidBodyDescription),
-            2: ("skeletons", SkeletonDescription),
-            3: ("force_plates", ForcePlateDescription),
-            4: ("devices", DeviceDescription),
-            5: ("cameras", CameraDescription)
-        }
-        data_dict = {n: [] for i, (n, f) in data_desc_types.items()}
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "DataDescriptions":
+        # One list per field, indexed by the data type id of the descriptions
+        bins = tuple([] for _ in _DESC_TYPES)
         # # of data sets to process
         dataset_count = buffer.read_uint32()
         for i in range(0, dataset_count):
             data_type = buffer.read_uint32()
-            if data_type in data_desc_types:
-                name, desc_type = data_desc_types[data_type]
-                unpacked_data = desc_type.read_from_buffer(buffer, protocol_version)
-                data_dict[name].append(unpacked_data)
+            if data_type < len(_DESC_TYPES):
+                bins[data_type].append(_DESC_TYPES[data_type].read_from_buffer(buffer, protocol_flags))
             else:
-                print(f"Type: {data_type} unknown. Stopped processing at {buffer.pointer}/{len(buffer.data)} bytes "
-                      f"({i + 1}/{dataset_count}) datasets.")
-        return DataDescriptions(**data_dict)
+                # The size of an unknown description is unknown as well, hence the remainder cannot be parsed
+                _logger.warning("Type: %d unknown. Stopped processing at %d/%d bytes (%d/%d) datasets.", data_type,
+                                buffer.pointer, len(buffer.data), i + 1, dataset_count)
+                break
+        return DataDescriptions(*map(tuple, bins))
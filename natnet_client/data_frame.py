@@ -1,45 +1,94 @@
+import array
+import struct
 from dataclasses import dataclass, fields
+from functools import lru_cache
 from inspect import isclass
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Callable, Any, Type
 
 from .data_types import Vec3, Vec4
 from .packet_buffer import PacketBuffer
-from .packet_component import PacketComponent
+from .packet_component import PacketComponent, PacketComponentArray
+from .protocol_flags import ProtocolFlags
 from .version import Version
 
+# Fixed record layouts, which allow decoding whole arrays of components in a single pass
+# Rigid body since version 3.0: id, pos, rot, marker error, param
+_RIGID_BODY_STRUCT_V3 = struct.Struct("<I7ffH")
+# Labeled marker: id, pos, size, param (version 2.6 and later), residual (version 3.0 and later), indexed by
+# ge2_6 + ge3
+_LABELED_MARKER_STRUCTS = (struct.Struct("<I4f"), struct.Struct("<I4fH"), struct.Struct("<I4fHf"))
+
+# Runs of consecutive scalar fields, which are read with a single call
+# Rigid body: id, pos, rot
+_RIGID_BODY_HEAD_STRUCT = struct.Struct("<I7f")
+# Rigid body: marker error (version 2.0 and later), param (version 2.6 and later), indexed by ge2 + ge2_6
+_RIGID_BODY_TAIL_STRUCTS = (struct.Struct("<"), struct.Struct("<f"), struct.Struct("<fH"))
+# Frame suffix: timecode, timecode sub, timestamp (double precision in version 2.7 and later), indexed by ge2_7
+_FRAME_SUFFIX_HEAD_STRUCTS = (struct.Struct("<IIf"), struct.Struct("<IId"))
+# Frame suffix since version 3.0: camera mid exposure, data received and transmit timestamps
+_FRAME_SUFFIX_STAMPS_STRUCT = struct.Struct("<QQQ")
+# Force plate and device: id, channel count
+_UINT32_PAIR_STRUCT = struct.Struct("<II")
+# Labeled marker fields decoded from the bits 0 to 5 of param
+_LABELED_MARKER_PARAM_FIELDS = ("occluded", "point_cloud_solved", "model_solved", "has_model", "unlabeled", "active")
+
+
+class _FrozenSlots:
+    # Frozen dataclasses with __slots__ cannot be restored by the default pickle/copy mechanism, as it assigns the
+    # slots via setattr
+    __slots__ = ()
+
+    def __getstate__(self):
+        return tuple(getattr(self, f.name) for f in fields(self))
+
+    def __setstate__(self, state):
+        for f, value in zip(fields(self), state):
+            object.__setattr__(self, f.name, value)
+        # Restore derived slots
+        if hasattr(self, "__post_init__"):
+            self.__post_init__()
+
 
 @dataclass(frozen=True)
-class FramePrefix(PacketComponent):
+class FramePrefix(_FrozenSlots, PacketComponent):
+    __slots__ = ("frame_number",)
+
     frame_number: int
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "FramePrefix":
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "FramePrefix":
         return FramePrefix(buffer.read_uint32())
 
 
 @dataclass(frozen=True)
-class MarkerSet(PacketComponent):
+class MarkerSet(_FrozenSlots, PacketComponent):
+    __slots__ = ("model_name", "marker_pos_list")
+
     model_name: str
     marker_pos_list: Tuple[Vec3, ...]
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "MarkerSet":
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "MarkerSet":
         model_name = buffer.read_string()
         marker_count = buffer.read_uint32()
-        marker_pos_list = [buffer.read_float32_array(3) for _ in range(marker_count)]
-        return MarkerSet(model_name, tuple(marker_pos_list))
+        marker_pos_list = buffer.read_float32_matrix(marker_count, 3)
+        return MarkerSet(model_name, marker_pos_list)
 
 
 # Only used up until version 3.0, where this information has been moved to the description
 @dataclass(frozen=True)
-class RigidBodyMarker:
+class RigidBodyMarker(_FrozenSlots):
+    __slots__ = ("pos", "id_num", "size")
+
     pos: Vec3
     id_num: Optional[int]
     size: Optional[int]
 
 
 @dataclass(frozen=True)
-class RigidBody(PacketComponent):
+class RigidBody(_FrozenSlots, PacketComponent, PacketComponentArray):
+    __slots__ = ("id_num", "pos", "rot", "markers", "tracking_valid", "marker_error")
+
     id_num: int
     pos: Vec3
     rot: Vec4
@@ -48,142 +97,135 @@ class RigidBody(PacketComponent):
     marker_error: Optional[float]
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "RigidBody":
-        id_num = buffer.read_uint32()
-        pos = buffer.read_float32_array(3)
-        rot = buffer.read_float32_array(4)
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "RigidBody":
+        id_num, x, y, z, qx, qy, qz, qw = buffer.read(_RIGID_BODY_HEAD_STRUCT)
+        pos = (x, y, z)
+        rot = (qx, qy, qz, qw)
         # RB Marker Data ( Before version 3.0.  After Version 3.0 Marker data is in description )
-        if protocol_version < Version(3, 0):
+        if not protocol_flags.ge3:
             marker_count = buffer.read_uint32()
-            marker_positions = [buffer.read_float32_array(3) for _ in range(marker_count)]
+            marker_positions = buffer.read_float32_matrix(marker_count, 3)
 
-            if protocol_version >= Version(2):
-                marker_ids = [buffer.read_uint32() for _ in range(marker_count)]
-                marker_sizes = [buffer.read_float32() for _ in range(marker_count)]
+            if protocol_flags.ge2:
+                marker_ids = buffer.read_uint32_array(marker_count)
+                marker_sizes = buffer.read_float32_array(marker_count)
             else:
-                marker_ids = marker_sizes = [None for _ in range(marker_count)]
+                marker_ids = marker_sizes = [None] * marker_count
 
-            markers = [RigidBodyMarker(*f) for f in zip(marker_positions, marker_ids, marker_sizes)]
+            markers = tuple(map(RigidBodyMarker, marker_positions, marker_ids, marker_sizes))
         else:
             markers = None
-        if protocol_version >= Version(2):
-            marker_error = buffer.read_float32()
-        else:
-            marker_error = None
-
-        # Version 2.6 and later
-        if protocol_version >= Version(2, 6):
-            param = buffer.read_uint16()
-            tracking_valid = (param & 0x01) != 0
-        else:
-            tracking_valid = None
+        # Fields missing in older versions are padded with None
+        level = protocol_flags.ge2 + protocol_flags.ge2_6
+        marker_error, param = buffer.read(_RIGID_BODY_TAIL_STRUCTS[level]) + (None,) * (2 - level)
+        tracking_valid = None if param is None else (param & 0x01) != 0
 
         return RigidBody(id_num, pos, rot, markers, tracking_valid, marker_error)
 
+    @classmethod
+    def read_array_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "Tuple[RigidBody, ...]":
+        rigid_body_count = buffer.read_uint32()
+        if protocol_flags.ge3:
+            # Rigid bodies do not carry marker data anymore and have a fixed layout
+            return tuple(
+                RigidBody(id_num, (x, y, z), (qx, qy, qz, qw), None, (param & 0x01) != 0, marker_error)
+                for id_num, x, y, z, qx, qy, qz, qw, marker_error, param in
+                buffer.read_array(_RIGID_BODY_STRUCT_V3, rigid_body_count))
+        read_rigid_body = cls.read_from_buffer
+        return tuple(read_rigid_body(buffer, protocol_flags) for _ in range(rigid_body_count))
+
 
 @dataclass(frozen=True)
-class Skeleton(PacketComponent):
+class Skeleton(_FrozenSlots, PacketComponent):
+    __slots__ = ("id_num", "rigid_bodies")
+
     id_num: int
     rigid_bodies: Tuple[RigidBody, ...]
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "Skeleton":
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "Skeleton":
         id_num = buffer.read_uint32()
-        rigid_body_count = buffer.read_uint32()
-        rigid_bodies = [RigidBody.read_from_buffer(buffer, protocol_version) for _ in range(rigid_body_count)]
+        rigid_bodies = RigidBody.read_array_from_buffer(buffer, protocol_flags)
 
-        return Skeleton(id_num, tuple(rigid_bodies))
+        return Skeleton(id_num, rigid_bodies)
 
 
 @dataclass(frozen=True)
-class LabeledMarker(PacketComponent):
+class LabeledMarker(_FrozenSlots, PacketComponent, PacketComponentArray):
+    __slots__ = ("id_num", "pos", "size", "param", "residual", "model_id", "marker_id", "occluded",
+                 "point_cloud_solved", "model_solved", "has_model", "unlabeled", "active")
+
     id_num: int
     pos: Vec3
     size: int
     param: Optional[int]
     residual: Optional[float]
 
-    @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "LabeledMarker":
-        id_num = buffer.read_uint32()
-        pos = buffer.read_float32_array(3)
-        size = buffer.read_float32()
-
-        # Version 2.6 and later
-        if protocol_version >= Version(2, 6):
-            param = buffer.read_uint16()
-        else:
-            param = None
-
-        # Version 3.0 and later
-        if protocol_version >= Version(3):
-            residual = buffer.read_float32()
+    # The remaining slots (model_id, marker_id and the param bits) are no dataclass fields but are decoded from id_num
+    # and param on construction, as they are typically queried for every marker of every frame
+    def __post_init__(self):
+        set_field = object.__setattr__
+        set_field(self, "model_id", self.id_num >> 16)
+        set_field(self, "marker_id", self.id_num & 0x0000ffff)
+        param = self.param
+        if param is None:
+            bits = (None,) * 6
         else:
-            residual = None
-
-        return cls(id_num, pos, size, param, residual)
-
-    @property
-    def model_id(self):
-        return self.id_num >> 16
-
-    @property
-    def marker_id(self):
-        return self.id_num & 0x0000ffff
+            bits = tuple((param & mask) != 0 for mask in (0x01, 0x02, 0x04, 0x08, 0x10, 0x20))
+        for name, value in zip(_LABELED_MARKER_PARAM_FIELDS, bits):
+            set_field(self, name, value)
 
-    @property
-    def occluded(self):
-        return bool(self.param & 0x01)
-
-    @property
-    def point_cloud_solved(self):
-        return bool(self.param & 0x02)
-
-    @property
-    def model_solved(self):
-        return bool(self.param & 0x04)
-
-    @property
-    def has_model(self):
-        return bool(self.param & 0x08)
-
-    @property
-    def unlabeled(self):
-        return bool(self.param & 0x10)
+    @classmethod
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "LabeledMarker":
+        # Fields missing in older versions are padded with None
+        level = protocol_flags.ge2_6 + protocol_flags.ge3
+        id_num, x, y, z, size, param, residual = buffer.read(_LABELED_MARKER_STRUCTS[level]) + (None,) * (2 - level)
+        return cls(id_num, (x, y, z), size, param, residual)
 
-    @property
-    def active(self):
-        return bool(self.param & 0x20)
+    @classmethod
+    def read_array_from_buffer(cls, buffer: PacketBuffer,
+                               protocol_flags: ProtocolFlags) -> "Tuple[LabeledMarker, ...]":
+        marker_count = buffer.read_uint32()
+        # The layout of a labeled marker only depends on the protocol version, hence all markers are decoded in one
+        # pass
+        level = protocol_flags.ge2_6 + protocol_flags.ge3
+        padding = (None,) * (2 - level)
+        return tuple(
+            cls(id_num, (x, y, z), size, param, residual)
+            for id_num, x, y, z, size, param, residual in
+            (record + padding for record in buffer.read_array(_LABELED_MARKER_STRUCTS[level], marker_count)))
 
 
+# Force plates and devices share the same layout: an id followed by a number of float32 channels
 @dataclass(frozen=True)
-class ForcePlate(PacketComponent):
+class _ChannelBlock(_FrozenSlots, PacketComponent):
+    __slots__ = ("id_num", "channel_arrays")
+
     id_num: int
     channel_arrays: Tuple[Tuple[float, ...], ...]
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "ForcePlate":
-        id_num = buffer.read_uint32()
-        channel_count = buffer.read_uint32()
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "_ChannelBlock":
+        id_num, channel_count = buffer.read(_UINT32_PAIR_STRUCT)
         channel_arrays = tuple(buffer.read_float32_array(buffer.read_uint32()) for _ in range(channel_count))
-        return ForcePlate(id_num, channel_arrays)
+        return cls(id_num, channel_arrays)
 
 
 @dataclass(frozen=True)
-class Device(PacketComponent):
-    id_num: int
-    channel_arrays: Tuple[Tuple[float, ...], ...]
+class ForcePlate(_ChannelBlock):
+    __slots__ = ()
 
-    @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "Device":
-        id_num = buffer.read_uint32()
-        channel_count = buffer.read_uint32()
-        channel_arrays = tuple(buffer.read_float32_array(buffer.read_uint32()) for _ in range(channel_count))
-        return Device(id_num, channel_arrays)
+
+@dataclass(frozen=True)
+class Device(_ChannelBlock):
+    __slots__ = ()
 
 
 @dataclass(frozen=True)
-class FrameSuffix(PacketComponent):
+class FrameSuffix(_FrozenSlots, PacketComponent):
+    __slots__ = ("timecode", "timecode_sub", "timestamp", "stamp_camera_mid_exposure", "stamp_data_received",
+                 "stamp_transmit", "param", "is_recording", "tracked_models_changed")
+
     timecode: int
     timecode_sub: int
     timestamp: float
@@ -195,22 +237,13 @@ class FrameSuffix(PacketComponent):
     tracked_models_changed: bool
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "FrameSuffix":
-        # Timecode
-        timecode = buffer.read_uint32()
-        timecode_sub = buffer.read_uint32()
-
-        # Timestamp (increased to double precision in 2.7 and later)
-        if protocol_version >= Version(2, 7):
-            timestamp = buffer.read_float64()
-        else:
-            timestamp = buffer.read_float32()
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "FrameSuffix":
+        # Timecode and timestamp (increased to double precision in 2.7 and later)
+        timecode, timecode_sub, timestamp = buffer.read(_FRAME_SUFFIX_HEAD_STRUCTS[protocol_flags.ge2_7])
 
         # Hires Timestamp (Version 3.0 and later)
-        if protocol_version >= Version(3):
-            stamp_camera_mid_exposure = buffer.read_uint64()
-            stamp_data_received = buffer.read_uint64()
-            stamp_transmit = buffer.read_uint64()
+        if protocol_flags.ge3:
+            stamp_camera_mid_exposure, stamp_data_received, stamp_transmit = buffer.read(_FRAME_SUFFIX_STAMPS_STRUCT)
         else:
             stamp_camera_mid_exposure = stamp_data_received = stamp_transmit = None
 
@@ -224,7 +257,10 @@ class FrameSuffix(PacketComponent):
 
 
 @dataclass(frozen=True)
-class DataFrame(PacketComponent):
+class DataFrame(_FrozenSlots, PacketComponent):
+    __slots__ = ("prefix", "marker_sets", "unlabeled_marker_pos", "rigid_bodies", "skeletons", "labeled_markers",
+                 "force_plates", "devices", "suffix")
+
     prefix: FramePrefix
     marker_sets: Tuple[MarkerSet, ...]
     unlabeled_marker_pos: Tuple[Vec3, ...]
@@ -248,23 +284,62 @@ class DataFrame(PacketComponent):
     }
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "DataFrame":
-        kwargs = {}
-
-        for field in fields(cls):
-            if protocol_version >= cls.MIN_VERSIONS[field.name]:
-                if isclass(field.type) and issubclass(field.type, PacketComponent):
-                    kwargs[field.name] = field.type.read_from_buffer(buffer, protocol_version)
-                else:
-                    # Type is a tuple
-                    element_count = buffer.read_uint32()
-                    generic_type = field.type.__args__[0]
-                    if generic_type == Vec3:
-                        kwargs[field.name] = tuple(buffer.read_float32_array(3) for _ in range(element_count))
-                    else:
-                        kwargs[field.name] = tuple(
-                            generic_type.read_from_buffer(buffer, protocol_version) for _ in range(element_count))
-            else:
-                kwargs[field.name] = None
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "DataFrame":
+        plan = _build_parse_plan(protocol_flags.version)
+        return cls(*[read(buffer, protocol_flags) for read in plan])
+
+
+_Reader = Callable[[PacketBuffer, ProtocolFlags], Any]
 
-        return cls(**kwargs)
+
+def _pack_version(version: Version) -> int:
+    # Major and minor version are transmitted as single bytes
+    return version.major * 256 + version.minor
+
+
+# Minimum protocol versions of the DataFrame fields in field order. DataFrame.MIN_VERSIONS is only read once here at
+# import time, later modifications of it do not affect parsing.
+_DATA_FRAME_MIN_VERSIONS = array.array("H", (_pack_version(DataFrame.MIN_VERSIONS[f.name]) for f in fields(DataFrame)))
+
+
+def _read_nothing(buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> None:
+    return None
+
+
+def _read_vec3_array(buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> Tuple[Vec3, ...]:
+    return buffer.read_float32_matrix(buffer.read_uint32(), 3)
+
+
+def _component_array_reader(component_type: Type[PacketComponent]) -> _Reader:
+    # Bound once here instead of looking up the classmethod for every element
+    read_component = component_type.read_from_buffer
+
+    def read(buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> Tuple[PacketComponent, ...]:
+        element_count = buffer.read_uint32()
+        return tuple(read_component(buffer, protocol_flags) for _ in range(element_count))
+
+    return read
+
+
+@lru_cache(maxsize=8)
+def _build_parse_plan(version: Version) -> Tuple[_Reader, ...]:
+    # Resolves the reader of each DataFrame field once per protocol version, so that parsing a frame does not need to
+    # inspect the field types or compare versions anymore. Versions hash by their value, hence equal versions with a
+    # different number of components (e.g. 3.1 and 3.1.0.0) share a plan.
+    packed_version = _pack_version(version)
+    plan = []
+    for field, min_version in zip(fields(DataFrame), _DATA_FRAME_MIN_VERSIONS):
+        if packed_version < min_version:
+            plan.append(_read_nothing)
+        elif isclass(field.type) and issubclass(field.type, PacketComponent):
+            plan.append(field.type.read_from_buffer)
+        else:
+            # Type is a tuple
+            generic_type = field.type.__args__[0]
+            if generic_type == Vec3:
+                plan.append(_read_vec3_array)
+            elif issubclass(generic_type, PacketComponentArray):
+                plan.append(generic_type.read_array_from_buffer)
+            else:
+                plan.append(_component_array_reader(generic_type))
+    return tuple(plan)
@@ -0,0 +1,131 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import struct
+import sys
+from typing import List, Optional, Callable, Sequence, Tuple
+
+# Python's socket module does not expose recvmmsg(2) and sendmmsg(2), which receive and send multiple datagrams with a
+# single system call. They are hence called via ctypes on Linux, where they are available in the C library.
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t)
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int)
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint)
+    ]
+
+
+def _load_libc_function(name: str, argtypes: Tuple) -> Optional[Callable]:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        func = getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = argtypes
+    func.restype = ctypes.c_int
+    return func
+
+
+_recvmmsg = _load_libc_function(
+    "recvmmsg", (ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p))
+_sendmmsg = _load_libc_function("sendmmsg", (ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int))
+
+
+def recvmmsg_available() -> bool:
+    return _recvmmsg is not None
+
+
+def sendmmsg_available() -> bool:
+    return _sendmmsg is not None
+
+
+def _raise_errno():
+    error = ctypes.get_errno()
+    raise OSError(error, os.strerror(error))
+
+
+def send_datagrams(out_socket: socket.socket, packets: Sequence[bytes], address: Tuple[str, int]):
+    # Sends the packets to an IPv4 address with as few system calls as possible
+    if _sendmmsg is None:
+        raise OSError("sendmmsg is not available on this platform.")
+    host, port = address
+    # struct sockaddr_in: family (host byte order), port and address (network byte order), zero padding
+    sockaddr = ctypes.create_string_buffer(
+        struct.pack("=H", socket.AF_INET) + struct.pack("!H", port) + socket.inet_aton(host) + bytes(8), 16)
+    buffers = [ctypes.create_string_buffer(packet, len(packet)) for packet in packets]
+    iovecs = (_IoVec * len(packets))()
+    messages = (_MMsgHdr * len(packets))()
+    for buf, iovec, message in zip(buffers, iovecs, messages):
+        iovec.iov_base = ctypes.addressof(buf)
+        iovec.iov_len = len(buf)
+        message.msg_hdr.msg_name = ctypes.addressof(sockaddr)
+        message.msg_hdr.msg_namelen = ctypes.sizeof(sockaddr)
+        message.msg_hdr.msg_iov = ctypes.pointer(iovec)
+        message.msg_hdr.msg_iovlen = 1
+    sent = 0
+    # sendmmsg may send fewer messages than requested
+    while sent < len(packets):
+        remaining = ctypes.cast(ctypes.addressof(messages) + sent * ctypes.sizeof(_MMsgHdr), ctypes.POINTER(_MMsgHdr))
+        result = _sendmmsg(out_socket.fileno(), remaining, len(packets) - sent, 0)
+        if result < 0:
+            if ctypes.get_errno() == errno.EINTR:
+                continue
+            _raise_errno()
+        sent += result
+
+
+class RecvMMsgReceiver:
+    # Receives the datagrams queued on a socket into a pool of buffers, which is allocated once. As the buffers are
+    # reused, a receiver must not be shared between threads.
+    def __init__(self, batch_size: int, buffer_size: int):
+        if _recvmmsg is None:
+            raise OSError("recvmmsg is not available on this platform.")
+        self.__batch_size = batch_size
+        self.__buffer_size = buffer_size
+        self.__buffers = [ctypes.create_string_buffer(buffer_size) for _ in range(batch_size)]
+        self.__iovecs = (_IoVec * batch_size)()
+        self.__messages = (_MMsgHdr * batch_size)()
+        for buf, iovec, message in zip(self.__buffers, self.__iovecs, self.__messages):
+            iovec.iov_base = ctypes.addressof(buf)
+            iovec.iov_len = buffer_size
+            message.msg_hdr.msg_iov = ctypes.pointer(iovec)
+            message.msg_hdr.msg_iovlen = 1
+
+    @property
+    def buffer_size(self) -> int:
+        return self.__buffer_size
+
+    def receive(self, in_socket: socket.socket, max_count: Optional[int] = None) -> List[bytes]:
+        # Never blocks, returns an empty list if no datagram is queued
+        count = self.__batch_size if max_count is None else min(max_count, self.__batch_size)
+        received = _recvmmsg(in_socket.fileno(), self.__messages, count, socket.MSG_DONTWAIT, None)
+        if received < 0:
+            if ctypes.get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            _raise_errno()
+        # Only the received bytes are copied out of the buffers
+        return [ctypes.string_at(self.__buffers[i], self.__messages[i].msg_len) for i in range(received)]
@@ -1,13 +1,20 @@
-﻿import socket
-from threading import Thread
+﻿import asyncio
+import logging
+import os
+import queue
+import socket
+import struct
+from threading import Thread, Event as ThreadEvent
 import time
-from typing import Optional
+from typing import Optional, List, Dict, Callable
 
 from .data_frame import DataFrame
 from .event import Event
+from .mmsg import RecvMMsgReceiver, recvmmsg_available, send_datagrams, sendmmsg_available
 from .server_info import ServerInfo
 from .data_descriptions import DataDescriptions
 from .packet_buffer import PacketBuffer
+from .protocol_flags import ProtocolFlags
 from .version import Version
 
 
@@ -27,7 +34,40 @@ class NatNetProtocolError(NatNetError):
     pass
 
 
+_logger = logging.getLogger(__name__)
+
+# Message id, packet size
+_PACKET_HEADER_STRUCT = struct.Struct("<HH")
+# struct ip_mreq: multicast group address, local interface address (both in network byte order)
+_IP_MREQ_STRUCT = struct.Struct("4s4s")
+
+
+def _build_request_packet(command: int, command_str: str) -> bytes:
+    encoded = command_str.encode("utf-8")
+    packet = bytearray(_PACKET_HEADER_STRUCT.size + len(encoded) + 1)
+    _PACKET_HEADER_STRUCT.pack_into(packet, 0, command, len(encoded) + 1)
+    packet[_PACKET_HEADER_STRUCT.size:-1] = encoded
+    return bytes(packet)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_datagram: Callable[[bytes], None]):
+        self.__on_datagram = on_datagram
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) > 0:
+            self.__on_datagram(data)
+
+
 class NatNetClient:
+    # Maximum number of datagrams received and processed back-to-back per socket poll
+    RECV_BATCH_SIZE = 16
+    # Minimum time between two keep-alive requests in seconds
+    KEEPALIVE_INTERVAL = 1.0
+    # Maximum number of received data frames waiting for the parser thread (about one second of a 240 Hz stream). If
+    # parsing or the callbacks fall behind, the oldest frames are dropped instead of letting latency grow.
+    RX_QUEUE_SIZE = 256
+
     # Client/server message ids
     NAT_CONNECT = 0
     NAT_SERVERINFO = 1
@@ -42,41 +82,101 @@ class NatNetClient:
     NAT_KEEPALIVE = 10
     NAT_UNRECOGNIZED_REQUEST = 100
 
+    # Requests with a fixed payload are only built once
+    __CONSTANT_REQUESTS = {
+        NAT_CONNECT: _build_request_packet(NAT_CONNECT, "Ping"),
+        NAT_REQUEST_MODELDEF: _build_request_packet(NAT_REQUEST_MODELDEF, ""),
+        NAT_REQUEST_FRAMEOFDATA: _build_request_packet(NAT_REQUEST_FRAMEOFDATA, ""),
+        NAT_KEEPALIVE: _build_request_packet(NAT_KEEPALIVE, "")
+    }
+
     def __init__(self, server_ip_address: str = "127.0.0.1", local_ip_address: str = "127.0.0.1",
                  multicast_address: str = "239.255.42.99", command_port: int = 1510, data_port: int = 1511,
-                 use_multicast: bool = True):
+                 use_multicast: bool = True, recv_buffer_bytes: Optional[int] = 8 * 1024 * 1024,
+                 use_recvmmsg: bool = True, cpu_affinity: Optional[int] = None):
         self.__server_ip_address = server_ip_address
         self.__local_ip_address = local_ip_address
         self.__multicast_address = multicast_address
         self.__command_port = command_port
         self.__data_port = data_port
         self.__use_multicast = use_multicast
+        # Multicast group membership request of the data socket (unicast accepts any local address, e.g. host names)
+        self.__mreq = None
+        if use_multicast:
+            self.__mreq = _IP_MREQ_STRUCT.pack(socket.inet_aton(multicast_address), socket.inet_aton(local_ip_address))
+        # Kernel receive buffer size of the sockets (None keeps the system default)
+        self.__recv_buffer_bytes = recv_buffer_bytes
+        # Receive queued datagrams with a single system call where possible (Linux only)
+        self.__use_recvmmsg = use_recvmmsg and recvmmsg_available()
+        self.__batch_receivers: Dict[socket.socket, RecvMMsgReceiver] = {}
+        # CPU the data receive and parser threads are pinned to (Linux only, None disables pinning)
+        if cpu_affinity is not None and hasattr(os, "sched_getaffinity"):
+            # Checked here, as an error in the data thread would only terminate the thread
+            available_cpus = os.sched_getaffinity(0)
+            if cpu_affinity not in available_cpus:
+                raise ValueError(f"CPU {cpu_affinity} is not available to this process, available CPUs are "
+                                 f"{sorted(available_cpus)}.")
+        self.__cpu_affinity = cpu_affinity
+        # Send bursts of requests with a single system call where possible (Linux only, IPv4 server address)
+        self.__use_sendmmsg = sendmmsg_available() and self.__is_ipv4_address(server_ip_address)
 
         self.__server_info = None
+        # Set as soon as the server info has been received
+        self.__server_info_event = ThreadEvent()
 
         # NatNet stream version. This will be updated to the actual version the server is using during runtime.
-        self.__current_protocol_version: Optional[Version] = None
+        self.__protocol_flags: Optional[ProtocolFlags] = None
 
         self.__command_thread = None
         self.__data_thread = None
+        self.__parser_thread = None
+        # Transports of the sockets if connected via connect_async
+        self.__transports: List[asyncio.DatagramTransport] = []
+        self.__keep_alive_handle: Optional[asyncio.TimerHandle] = None
+        # Received packets, which are handed from the socket threads to the parser thread
+        self.__rx_queue: Optional[queue.Queue] = None
+        # All other received packets (e.g. replies to requests), which are never resent and hence never dropped
+        self.__reply_queue: Optional[queue.SimpleQueue] = None
         self.__command_socket: Optional[socket.socket] = None
         self.__data_socket: Optional[socket.socket] = None
 
         self.__stop_threads = False
+        self.__last_keep_alive = 0.0
+
+        # Receive buffer and packet buffer of the synchronous receive path, which are reused for every packet
+        self.__recv_buffer = bytearray(64 * 1024)
+        self.__packet_buffer = PacketBuffer(b"")
 
         self.__on_data_frame_received_event = Event()
         self.__on_data_description_received_event = Event()
 
+    @staticmethod
+    def __is_ipv4_address(addr: str) -> bool:
+        try:
+            socket.inet_aton(addr)
+            return True
+        except OSError:
+            return False
+
     @property
     def connected(self):
         return self.__command_socket is not None and self.__data_socket is not None and self.__server_info is not None
 
     @staticmethod
-    def __create_socket(addr: str = "", port: int = 0):
+    def __create_socket(addr: str = "", port: int = 0, recv_buffer_bytes: Optional[int] = None):
         # Create a command socket to attach to the NatNet stream
         result = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         # allow multiple clients on same machine to use multicast group address/port
         result.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if recv_buffer_bytes is not None:
+            # A large receive buffer absorbs bursts of frames while Python is busy (e.g. with garbage collection or
+            # user callbacks). On Linux, the size is capped by the net.core.rmem_max sysctl. Other systems reject
+            # sizes above their limit (e.g. kern.ipc.maxsockbuf on macOS), in which case the default size is kept.
+            try:
+                result.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, recv_buffer_bytes)
+            except OSError as ex:
+                _logger.warning("Failed to set the socket receive buffer size to %d bytes, keeping the system default: "
+                                "%s", recv_buffer_bytes, ex)
         try:
             result.bind((addr, port))
         except:
@@ -91,7 +191,7 @@ class NatNetClient:
         else:
             addr = self.__local_ip_address
         try:
-            result = self.__create_socket(addr, 0)
+            result = self.__create_socket(addr, 0, self.__recv_buffer_bytes)
         except socket.error as ex:
             raise NatNetNetworkError("Command", self.__use_multicast, ex)
 
@@ -108,67 +208,208 @@ class NatNetClient:
             addr = ""
             port = 0
         try:
-            result = self.__create_socket(addr, port)
+            result = self.__create_socket(addr, port, self.__recv_buffer_bytes)
         except socket.error as ex:
             raise NatNetNetworkError("Data", self.__use_multicast, ex)
 
         if self.__use_multicast:
-            result.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
-                              socket.inet_aton(self.__multicast_address) + socket.inet_aton(self.__local_ip_address))
+            result.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, self.__mreq)
         return result
 
     def __socket_thread_func(self, in_socket: socket.socket, recv_buffer_size: int = 64 * 1024,
-                             send_keep_alive: bool = False):
+                             send_keep_alive: bool = False, cpu_affinity: Optional[int] = None):
+        self.__pin_current_thread(cpu_affinity)
+        # The socket threads only receive, so that they spend their time in the kernel without holding the GIL and
+        # the receive queues of the sockets are emptied while packets are being parsed
+        rx_queue = self.__rx_queue
+        reply_queue = self.__reply_queue
+        # Frames dropped since the queue became full and the time they were last reported
+        dropped = 0
+        last_drop_warning = 0.0
         while not self.__stop_threads:
+            if send_keep_alive:
+                self.__send_keep_alive_if_due()
             # Use timeout to ensure that thread can terminate
-            self.__process_socket(in_socket, recv_buffer_size=recv_buffer_size, send_keep_alive=send_keep_alive)
+            for data in self.__receive_datagrams(in_socket, recv_buffer_size):
+                if len(data) > 0:
+                    if int.from_bytes(data[:2], "little") != self.NAT_FRAMEOFDATA:
+                        reply_queue.put(data)
+                        # Wake up the parser thread. If the queue is full, the parser is busy and takes the reply
+                        # before the next frame anyway.
+                        try:
+                            rx_queue.put_nowait(None)
+                        except queue.Full:
+                            pass
+                        continue
+                    try:
+                        rx_queue.put_nowait(data)
+                    except queue.Full:
+                        self.__replace_oldest(rx_queue, data)
+                        dropped += 1
+                        # Report at most once per second, as the parser falls behind on every frame while overloaded
+                        now = time.monotonic()
+                        if now - last_drop_warning >= 1.0:
+                            _logger.warning("Receive queue is full, dropped %d of the oldest frames so far.", dropped)
+                            last_drop_warning = now
+            # The overload is considered over once the parser has caught up with half of the queue, which is also
+            # checked when no packets arrive anymore
+            if dropped > 0 and rx_queue.qsize() <= self.RX_QUEUE_SIZE // 2:
+                _logger.warning("Receive queue has recovered after dropping %d frames.", dropped)
+                dropped = 0
+        if dropped > 0:
+            _logger.warning("Receive queue was still full on stop, dropped %d frames.", dropped)
+
+    @staticmethod
+    def __replace_oldest(rx_queue: queue.Queue, data: bytes):
+        # The queue only holds frames and wake-up markers, which can both be dropped
+        try:
+            rx_queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            rx_queue.put_nowait(data)
+        except queue.Full:
+            # The other socket thread refilled the queue meanwhile, hence this packet is dropped
+            pass
+
+    @staticmethod
+    def __pin_current_thread(cpu_affinity: Optional[int]):
+        if cpu_affinity is not None and hasattr(os, "sched_setaffinity"):
+            try:
+                # Pid 0 refers to the calling thread
+                os.sched_setaffinity(0, {cpu_affinity})
+            except OSError as ex:
+                # The CPUs available to the process may have changed since construction, in which case the thread
+                # keeps running unpinned
+                _logger.warning("Failed to pin thread to CPU %d: %s", cpu_affinity, ex)
+
+    def __parser_thread_func(self, cpu_affinity: Optional[int] = None):
+        self.__pin_current_thread(cpu_affinity)
+        rx_queue = self.__rx_queue
+        reply_queue = self.__reply_queue
+        packet_buffer = PacketBuffer(b"")
+        while not self.__stop_threads:
+            try:
+                # Use timeout to ensure that thread can terminate
+                data = rx_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            # Replies take precedence over the queued frames
+            while not reply_queue.empty():
+                packet_buffer.reset(reply_queue.get())
+                self.__process_message(packet_buffer)
+            if data is not None:
+                packet_buffer.reset(data)
+                self.__process_message(packet_buffer)
 
     def __process_socket(self, in_socket: socket.socket, recv_buffer_size: int = 64 * 1024,
                          send_keep_alive: bool = False):
         if send_keep_alive:
+            self.__send_keep_alive_if_due()
+        if len(self.__recv_buffer) < recv_buffer_size:
+            self.__recv_buffer = bytearray(recv_buffer_size)
+        # Only the first receive may block (according to the socket timeout). Its datagram is received into the
+        # preallocated buffer and parsed in place.
+        try:
+            size = in_socket.recv_into(self.__recv_buffer, recv_buffer_size)
+        except (BlockingIOError, socket.timeout):
+            return False
+        packet_buffer = self.__packet_buffer
+        received = size > 0
+        if received:
+            packet_buffer.reset(memoryview(self.__recv_buffer)[:size])
+            self.__process_message(packet_buffer)
+        for data in self.__drain_datagrams(in_socket, recv_buffer_size, self.RECV_BATCH_SIZE - 1):
+            if len(data) > 0:
+                packet_buffer.reset(data)
+                self.__process_message(packet_buffer)
+                received = True
+        return received
+
+    def __send_keep_alive_if_due(self):
+        now = time.monotonic()
+        if now - self.__last_keep_alive >= self.KEEPALIVE_INTERVAL:
             self.send_request(self.NAT_KEEPALIVE)
+            self.__last_keep_alive = now
+
+    def __receive_datagrams(self, in_socket: socket.socket, recv_buffer_size: int) -> List[bytes]:
+        # Only the first receive may block (according to the socket timeout)
         try:
             data, addr = in_socket.recvfrom(recv_buffer_size)
-            if len(data) > 0:
-                self.__process_message(PacketBuffer(data))
-                return True
         except (BlockingIOError, socket.timeout):
+            return []
+        return [data] + self.__drain_datagrams(in_socket, recv_buffer_size, self.RECV_BATCH_SIZE - 1)
+
+    def __drain_datagrams(self, in_socket: socket.socket, recv_buffer_size: int, max_count: int) -> List[bytes]:
+        # Receives up to max_count datagrams that are already queued without blocking
+        batch_receiver = self.__batch_receivers.get(in_socket)
+        if batch_receiver is not None and batch_receiver.buffer_size >= recv_buffer_size:
+            # All of them at once with a single system call
+            return batch_receiver.receive(in_socket, max_count)
+        # Python waits for the socket timeout before each receive regardless of MSG_DONTWAIT, hence the socket is
+        # switched to non-blocking mode meanwhile
+        datagrams = []
+        timeout = in_socket.gettimeout()
+        if timeout != 0.0:
+            in_socket.settimeout(0.0)
+        try:
+            while len(datagrams) < max_count:
+                data, addr = in_socket.recvfrom(recv_buffer_size)
+                datagrams.append(data)
+        except BlockingIOError:
             pass
-        return False
+        finally:
+            if timeout != 0.0:
+                in_socket.settimeout(timeout)
+        return datagrams
 
     def __process_message(self, buffer: PacketBuffer):
-        message_id = buffer.read_uint16()
-        packet_size = buffer.read_uint16()
+        message_id, packet_size = buffer.read(_PACKET_HEADER_STRUCT)
         if len(buffer.data) - 4 != packet_size:
-            print(f"Warning: actual packet size ({len(buffer.data) - 4}) not consistent with packet size in the "
-                  f"header ({packet_size})")
-        if message_id == self.NAT_SERVERINFO:
-            self.__server_info = ServerInfo.read_from_buffer(buffer, self.__current_protocol_version)
-            self.__current_protocol_version = self.__server_info.nat_net_protocol_version
-        else:
-            if self.__current_protocol_version is None:
-                print(f"Warning: dropping packet of type {message_id} as server info has not been received yet.")
-            if message_id == self.NAT_FRAMEOFDATA:
-                data_frame = DataFrame.read_from_buffer(buffer, self.__current_protocol_version)
-                self.__on_data_frame_received_event.call(data_frame)
-            elif message_id == self.NAT_MODELDEF:
-                data_descs = DataDescriptions.read_from_buffer(buffer, self.__current_protocol_version)
-                self.__on_data_description_received_event.call(data_descs)
-    def send_request(self, command: int, command_str: str = ""):
-        if command in [self.NAT_REQUEST_MODELDEF, self.NAT_REQUEST_FRAMEOFDATA, self.NAT_KEEPALIVE]:
-            command_str = ""
-        if command == self.NAT_CONNECT:
-            command_str = "Ping"
-        packet_size = len(command_str) + 1
-
-        data = command.to_bytes(2, byteorder="little")
-        data += packet_size.to_bytes(2, byteorder="little")
-
-        data += command_str.encode("utf-8")
-        data += b"\0"
+            _logger.warning("Actual packet size (%d) not consistent with packet size in the header (%d)",
+                            len(buffer.data) - 4, packet_size)
+        if self.__protocol_flags is None and message_id != self.NAT_SERVERINFO:
+            # The layout of all other packets depends on the protocol version
+            _logger.warning("Dropping packet of type %d as server info has not been received yet.", message_id)
+            return
+        handler = self.__MESSAGE_HANDLERS.get(message_id)
+        if handler is not None:
+            handler(self, buffer)
+
+    def __on_server_info(self, buffer: PacketBuffer):
+        self.__server_info = ServerInfo.read_from_buffer(buffer, self.__protocol_flags)
+        self.__protocol_flags = ProtocolFlags.from_version(self.__server_info.nat_net_protocol_version)
+        self.__server_info_event.set()
+
+    def __on_frame_of_data(self, buffer: PacketBuffer):
+        data_frame = DataFrame.read_from_buffer(buffer, self.__protocol_flags)
+        self.__on_data_frame_received_event.call(data_frame)
+
+    def __on_model_def(self, buffer: PacketBuffer):
+        data_descs = DataDescriptions.read_from_buffer(buffer, self.__protocol_flags)
+        self.__on_data_description_received_event.call(data_descs)
+
+    # Handlers of the incoming message types, other messages are ignored
+    __MESSAGE_HANDLERS = {
+        NAT_SERVERINFO: __on_server_info,
+        NAT_FRAMEOFDATA: __on_frame_of_data,
+        NAT_MODELDEF: __on_model_def
+    }
 
+    def send_request(self, command: int, command_str: str = ""):
+        data = self.__CONSTANT_REQUESTS.get(command)
+        if data is None:
+            data = _build_request_packet(command, command_str)
         return self.__command_socket.sendto(data, (self.__server_ip_address, self.__command_port))
 
+    def __send_requests(self, packets: List[bytes]):
+        address = (self.__server_ip_address, self.__command_port)
+        if self.__use_sendmmsg and len(packets) > 1:
+            send_datagrams(self.__command_socket, packets, address)
+        else:
+            for packet in packets:
+                self.__command_socket.sendto(packet, address)
+
     def request_modeldef(self):
         self.send_request(self.NAT_REQUEST_MODELDEF)
 
@@ -177,22 +418,72 @@ class NatNetClient:
             raise NatNetError("NatNet client is not connected to a server.")
         return self.send_request(self.NAT_REQUEST, command_str)
 
+    def __open_sockets(self):
+        self.__data_socket = self.__create_data_socket(self.__data_port)
+        self.__command_socket = self.__create_command_socket()
+
     def connect(self, timeout: float = 5.0):
         if not self.connected:
-            self.__data_socket = self.__create_data_socket(self.__data_port)
-            self.__command_socket = self.__create_command_socket()
+            self.__open_sockets()
+            if self.__use_recvmmsg:
+                # One receiver per socket, as each socket is served by its own thread
+                self.__batch_receivers = {
+                    s: RecvMMsgReceiver(self.RECV_BATCH_SIZE - 1, 64 * 1024)
+                    for s in (self.__data_socket, self.__command_socket)}
 
             # Get NatNet and server versions
             self.send_request(self.NAT_CONNECT)
 
-            start_time = time.time()
-            while self.__server_info is None:
-                # Waiting for reply from server
-                self.__process_socket(self.__command_socket, send_keep_alive=not self.__use_multicast)
-                if self.__server_info is None and (time.time() - start_time) >= timeout:
-                    self.shutdown()
-                    raise TimeoutError()
-                time.sleep(0.1)
+            deadline = time.monotonic() + timeout
+            try:
+                while not self.__server_info_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shutdown()
+                        raise TimeoutError()
+                    # Waiting for reply from server, blocking until it arrives instead of polling
+                    self.__command_socket.settimeout(remaining)
+                    self.__process_socket(self.__command_socket, send_keep_alive=not self.__use_multicast)
+            finally:
+                if self.__command_socket is not None:
+                    self.__command_socket.settimeout(0.0)
+
+    async def connect_async(self, timeout: float = 5.0):
+        # Alternative to connect and run_async, which receives and processes the packets of both sockets in the running
+        # asyncio event loop instead of in additional threads until shutdown is called
+        if not self.connected:
+            loop = asyncio.get_running_loop()
+            self.__open_sockets()
+            server_info_received = loop.create_future()
+            packet_buffer = PacketBuffer(b"")
+
+            def on_datagram(data: bytes):
+                packet_buffer.reset(data)
+                self.__process_message(packet_buffer)
+                if self.__server_info_event.is_set() and not server_info_received.done():
+                    server_info_received.set_result(None)
+
+            try:
+                for s in (self.__data_socket, self.__command_socket):
+                    transport, _ = await loop.create_datagram_endpoint(lambda: _DatagramProtocol(on_datagram), sock=s)
+                    self.__transports.append(transport)
+
+                # Get NatNet and server versions
+                self.send_request(self.NAT_CONNECT)
+                if not self.__use_multicast:
+                    self.__keep_alive_async(loop)
+
+                await asyncio.wait_for(server_info_received, timeout)
+            except asyncio.TimeoutError:
+                self.shutdown()
+                raise TimeoutError()
+            except:
+                self.shutdown()
+                raise
+
+    def __keep_alive_async(self, loop: asyncio.AbstractEventLoop):
+        self.send_request(self.NAT_KEEPALIVE)
+        self.__keep_alive_handle = loop.call_later(self.KEEPALIVE_INTERVAL, self.__keep_alive_async, loop)
 
     def run_async(self):
         if not self.running_asynchronously:
@@ -202,8 +493,19 @@ class NatNetClient:
             self.__data_socket.settimeout(0.1)
             self.__command_socket.settimeout(0.1)
 
+            # Create a separate thread for parsing the received packets of both sockets
+            self.__rx_queue = queue.Queue(maxsize=self.RX_QUEUE_SIZE)
+            self.__reply_queue = queue.SimpleQueue()
+            # The parser runs on the same CPU as the data receive thread, so that the received frames are still in
+            # its cache when they are decoded
+            self.__parser_thread = Thread(
+                target=self.__parser_thread_func, kwargs={"cpu_affinity": self.__cpu_affinity})
+            self.__parser_thread.start()
+
             # Create a separate thread for receiving data packets
-            self.__data_thread = Thread(target=self.__socket_thread_func, args=(self.__data_socket,))
+            self.__data_thread = Thread(
+                target=self.__socket_thread_func, args=(self.__data_socket,),
+                kwargs={"cpu_affinity": self.__cpu_affinity})
             self.__data_thread.start()
 
             # Create a separate thread for receiving command packets
@@ -213,13 +515,19 @@ class NatNetClient:
             self.__command_thread.start()
 
     def stop_async(self):
+        if len(self.__transports) > 0:
+            # The transports own the sockets, hence the event loop cannot stop receiving without closing them
+            raise NatNetError("Cannot stop a client connected via connect_async, use shutdown instead.")
         if self.running_asynchronously:
             self.__stop_threads = True
             if self.__command_thread is not None:
                 self.__command_thread.join()
             if self.__data_thread is not None:
                 self.__data_thread.join()
-            self.__command_thread = self.__data_thread = None
+            if self.__parser_thread is not None:
+                self.__parser_thread.join()
+            self.__command_thread = self.__data_thread = self.__parser_thread = None
+            self.__rx_queue = self.__reply_queue = None
             self.__data_socket.settimeout(0.0)
             self.__command_socket.settimeout(0.0)
 
@@ -231,12 +539,20 @@ class NatNetClient:
             pass
 
     def shutdown(self):
+        if self.__keep_alive_handle is not None:
+            self.__keep_alive_handle.cancel()
+            self.__keep_alive_handle = None
+        for transport in self.__transports:
+            transport.close()
+        self.__transports = []
         self.stop_async()
         if self.__command_socket is not None:
             self.__command_socket.close()
         if self.__data_socket is not None:
             self.__data_socket.close()
         self.__command_socket = self.__data_socket = self.__server_info = None
+        self.__server_info_event.clear()
+        self.__batch_receivers = {}
 
     def __enter__(self):
         self.connect()
@@ -245,6 +561,13 @@ class NatNetClient:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.shutdown()
 
+    async def __aenter__(self):
+        await self.connect_async()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
     @property
     def on_data_frame_received_event(self) -> Event:
         return self.__on_data_frame_received_event
@@ -265,22 +588,23 @@ class NatNetClient:
 
     @property
     def protocol_version(self) -> Optional[Version]:
-        return self.__current_protocol_version
+        return None if self.__protocol_flags is None else self.__protocol_flags.version
 
     @protocol_version.setter
     def protocol_version(self, desired_version: Version):
         if not self.can_change_protocol_version:
             raise NatNetProtocolError("Server does not support changing the NatNet protocol version.")
         desired_version = desired_version.truncate(2)
-        if self.can_change_protocol_version and desired_version != self.__current_protocol_version.truncate(2):
+        if self.can_change_protocol_version and desired_version != self.protocol_version.truncate(2):
             sz_command = f"Bitstream,{desired_version}"
             return_code = self.send_command(sz_command)
             if return_code >= 0:
-                self.__current_protocol_version = desired_version
+                self.__protocol_flags = ProtocolFlags.from_version(desired_version)
                 self.send_command("TimelinePlay")
                 time.sleep(0.1)
-                for cmd in ["TimelinePlay", "TimelineStop", "SetPlaybackCurrentFrame,0", "TimelineStop"]:
-                    self.send_command(cmd)
+                self.__send_requests([
+                    _build_request_packet(self.NAT_REQUEST, cmd)
+                    for cmd in ["TimelinePlay", "TimelineStop", "SetPlaybackCurrentFrame,0", "TimelineStop"]])
                 time.sleep(2)
             else:
                 raise NatNetProtocolError("Failed to set NatNet protocol version")
@@ -311,4 +635,5 @@ class NatNetClient:
 
     @property
     def running_asynchronously(self):
-        return self.__command_thread is not None or self.__data_thread is not None
+        return self.__command_thread is not None or self.__data_thread is not None or \
+            self.__parser_thread is not None or len(self.__transports) > 0
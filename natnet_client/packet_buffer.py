@@ -1,10 +1,42 @@
 import struct
+from functools import lru_cache
 from typing import Optional, Union, Tuple, Any
 
+# Compiles the format strings passed to PacketBuffer.read only once
+_compile_struct = lru_cache(maxsize=128)(struct.Struct)
+
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_F32 = struct.Struct("<f")
+_F64 = struct.Struct("<d")
+
+
+@lru_cache(maxsize=128)
+def _array_struct(type_code: str, count: int) -> struct.Struct:
+    # Layout of count consecutive values, compiled once per count instead of building a format string of count
+    # characters on every read
+    return struct.Struct(f"<{count}{type_code}")
+
 
 class PacketBuffer:
+    # Slots make the attribute accesses of the read functions, which run for every field of every packet, cheaper
+    __slots__ = ("__data", "__raw", "pointer")
+
     def __init__(self, data: bytes):
-        self.__data = memoryview(data)  # Using a memoryview here ensures that slices do not create copies
+        self.reset(data)
+
+    def reset(self, data: bytes):
+        # Rebinds the buffer to a new packet, so that a single buffer can be reused for all received packets
+        # Using a memoryview here ensures that slices do not create copies. Casting it to unsigned bytes makes indices
+        # and lengths refer to bytes, independent of the format of the exporting object. Views of bytes that are
+        # passed in (e.g. slices of a receive buffer) are used as they are.
+        view = data if isinstance(data, memoryview) else memoryview(data)
+        if view.format != "B" or view.ndim != 1:
+            view = view.cast("B")
+        self.__data = view
+        # Keep the original object if it can be searched without copying
+        self.__raw = data if isinstance(data, (bytes, bytearray)) else None
         self.pointer = 0
 
     @property
@@ -13,39 +45,85 @@ class PacketBuffer:
 
     def read_string(self, max_length: Optional[int] = None, static_length: bool = False) -> str:
         if max_length is None:
-            data_slice = self.__data[self.pointer:]
+            limit = len(self.__data)
         else:
-            data_slice = self.__data[self.pointer:self.pointer + max_length]
-        str_enc, separator, remainder = bytes(data_slice).partition(b"\0")
-        str_dec = str_enc.decode("utf-8")
+            limit = min(self.pointer + max_length, len(self.__data))
+        end = self.__find_terminator(self.pointer, limit)
+        # Decoding directly from the view avoids an intermediate bytes object
+        str_dec = str(self.__data[self.pointer:end], "utf-8")
         if static_length:
             assert max_length is not None
             self.pointer += max_length
         else:
-            self.pointer += len(str_enc) + 1
+            self.pointer = end + 1
         return str_dec
 
+    def __find_terminator(self, start: int, limit: int) -> int:
+        # Returns the position of the first NUL byte in [start, limit) or limit if the string is unterminated
+        if self.__raw is not None:
+            end = self.__raw.find(b"\0", start, limit)
+            return limit if end == -1 else end
+        # Other buffers are searched in windows of growing size, as names are usually short
+        window = 64
+        while start < limit:
+            window_end = min(start + window, limit)
+            terminator = bytes(self.__data[start:window_end]).find(b"\0")
+            if terminator != -1:
+                return start + terminator
+            start = window_end
+            window *= 2
+        return limit
+
     def read(self, data_type: Union[struct.Struct, str]) -> Tuple[Any, ...]:
         if isinstance(data_type, str):
-            data_type = struct.Struct(data_type)
+            data_type = _compile_struct(data_type)
         values = data_type.unpack_from(self.__data, offset=self.pointer)
         self.pointer += data_type.size
         return values
 
+    def read_array(self, data_type: Union[struct.Struct, str], count: int) -> Tuple[Tuple[Any, ...], ...]:
+        # Unpacks count consecutive records of the given layout in a single pass
+        if isinstance(data_type, str):
+            data_type = _compile_struct(data_type)
+        end = self.pointer + count * data_type.size
+        # Slicing clamps to the end of the data, which would silently yield fewer records for truncated packets
+        if end > len(self.__data):
+            raise struct.error(f"reading {count} records of {data_type.size} bytes requires a buffer of at least "
+                               f"{end} bytes")
+        values = tuple(data_type.iter_unpack(self.__data[self.pointer:end]))
+        self.pointer = end
+        return values
+
     def read_uint16(self) -> int:
-        return self.read("H")[0]
+        value = _U16.unpack_from(self.__data, self.pointer)[0]
+        self.pointer += 2
+        return value
 
     def read_uint32(self) -> int:
-        return self.read("I")[0]
+        value = _U32.unpack_from(self.__data, self.pointer)[0]
+        self.pointer += 4
+        return value
+
+    def read_uint32_array(self, count: int) -> Tuple[int, ...]:
+        return self.read(_array_struct("I", count))
 
     def read_uint64(self) -> int:
-        return self.read("L")[0]
+        value = _U64.unpack_from(self.__data, self.pointer)[0]
+        self.pointer += 8
+        return value
 
     def read_float32(self) -> float:
-        return self.read("f")[0]
+        value = _F32.unpack_from(self.__data, self.pointer)[0]
+        self.pointer += 4
+        return value
 
     def read_float32_array(self, count: int) -> Tuple[float, ...]:
-        return self.read("f" * count)
+        return self.read(_array_struct("f", count))
+
+    def read_float32_matrix(self, rows: int, cols: int) -> Tuple[Tuple[float, ...], ...]:
+        return self.read_array(_array_struct("f", cols), rows)
 
     def read_float64(self) -> float:
-        return self.read("d")[0]
+        value = _F64.unpack_from(self.__data, self.pointer)[0]
+        self.pointer += 8
+        return value
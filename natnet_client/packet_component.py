@@ -3,18 +3,22 @@ from abc import ABC, abstractmethod
 from typing import Tuple
 
 from .packet_buffer import PacketBuffer
-from .version import Version
+from .protocol_flags import ProtocolFlags
 
 
 class PacketComponent(ABC):
+    __slots__ = ()
+
     @classmethod
     @abstractmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "PacketComponent":
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "PacketComponent":
         pass
 
 
 class PacketComponentArray(ABC):
+    __slots__ = ()
+
     @classmethod
     @abstractmethod
-    def read_array_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "Tuple[PacketComponent]":
+    def read_array_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "Tuple[PacketComponent]":
         pass
@@ -0,0 +1,20 @@
+from typing import NamedTuple
+
+from .version import Version
+
+
+# Version dependent features of the NatNet protocol. As the protocol version is constant for a session, these
+# comparisons are evaluated once instead of on every parsed component.
+class ProtocolFlags(NamedTuple("ProtocolFlagsFields", (
+        ("version", Version),
+        ("ge2", bool),
+        ("ge2_6", bool),
+        ("ge2_7", bool),
+        ("ge3", bool),
+        ("ge4", bool)))):
+    __slots__ = ()
+
+    @classmethod
+    def from_version(cls, version: Version) -> "ProtocolFlags":
+        return cls(version, version >= Version(2), version >= Version(2, 6), version >= Version(2, 7),
+                   version >= Version(3), version >= Version(4))
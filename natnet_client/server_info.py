@@ -1,18 +1,25 @@
+import struct
 from typing import NamedTuple
 
 from .packet_buffer import PacketBuffer
 from .packet_component import PacketComponent
+from .protocol_flags import ProtocolFlags
 from .version import Version
 
+# Application name (NUL padded), server version, NatNet protocol version
+_SERVER_INFO_STRUCT = struct.Struct("<256s4B4B")
+
 
 class ServerInfo(PacketComponent, NamedTuple("ServerInfoFields", (
         ("application_name", str),
         ("server_version", Version),
         ("nat_net_protocol_version", Version)))):
+    __slots__ = ()
 
     @classmethod
-    def read_from_buffer(cls, buffer: PacketBuffer, protocol_version: Version) -> "ServerInfo":
-        application_name = buffer.read_string(256, static_length=True)
-        server_version = Version(*buffer.read("BBBB"))
-        nat_net_protocol_version = Version(*buffer.read("BBBB"))
+    def read_from_buffer(cls, buffer: PacketBuffer, protocol_flags: ProtocolFlags) -> "ServerInfo":
+        name, *versions = buffer.read(_SERVER_INFO_STRUCT)
+        application_name = name.partition(b"\0")[0].decode("utf-8")
+        server_version = Version.get(*versions[:4])
+        nat_net_protocol_version = Version.get(*versions[4:])
         return cls(application_name, server_version, nat_net_protocol_version)
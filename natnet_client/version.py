@@ -1,90 +1,94 @@
-class Version:
-    def __init__(self, *components: int):
-        self.__components = tuple(components)
+from functools import total_ordering, lru_cache
+from typing import Union, Tuple
 
-    @property
-    def major(self):
-        return self.__components[0] if len(self.__components) > 0 else 0
+# Each component occupies 32 bits of the packed comparison key
+_MAX_COMPONENT = 0xFFFFFFFF
 
-    @property
-    def minor(self):
-        return self.__components[1] if len(self.__components) > 1 else 0
 
-    @property
-    def revision(self):
-        return self.__components[2] if len(self.__components) > 2 else 0
+@total_ordering
+class Version:
+    # Versions only hold the values computed in __init__, hence they do not need an instance dict
+    __slots__ = ("_components", "__key", "__str", "major", "minor", "revision", "build")
 
-    @property
-    def build(self):
-        return self.__components[3] if len(self.__components) > 3 else 0
+    def __init__(self, *components: int):
+        if len(components) > 4:
+            raise ValueError(f"Expected at most 4 version components, got {len(components)}")
+        if not all(0 <= c <= _MAX_COMPONENT for c in components):
+            raise ValueError(f"Version components must be in the range [0, {_MAX_COMPONENT}], got {components}")
+        # Variadic arguments are already collected in a tuple, which can be stored without copying
+        self.__assign(components)
+
+    def __assign(self, components: Tuple[int, ...]):
+        # The slots are only assigned here, __setattr__ rejects any later modification
+        set_field = object.__setattr__
+        set_field(self, "_components", components)
+        # Plain attributes instead of properties, as they are read frequently
+        major, minor, revision, build = (components + (0, 0, 0, 0))[:4]
+        set_field(self, "major", major)
+        set_field(self, "minor", minor)
+        set_field(self, "revision", revision)
+        set_field(self, "build", build)
+        # All components packed into a single integer, which serves as key for comparison and hashing. Missing
+        # components count as zero, hence e.g. 3.1 and 3.1.0.0 are equal.
+        set_field(self, "_Version__key", (major << 96) | (minor << 64) | (revision << 32) | build)
+        # Versions are immutable, hence they are formatted only once
+        set_field(self, "_Version__str", ".".join(map(str, components)))
+
+    def __setattr__(self, name, value):
+        # Instances are shared (see get) and used as cache keys, hence they must not change
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # The default pickle/copy mechanism would restore the slots via setattr
+        return type(self), self._components
 
     def truncate(self, pos: int):
-        return Version(*self.__components[:pos])
+        # Versions are immutable, hence a version that has no components beyond pos can be returned as it is
+        if pos >= len(self._components):
+            return self
+        # The components of this version are valid already, so they are assigned without validating them again
+        version = Version.__new__(Version)
+        version.__assign(self._components[:pos])
+        return version
 
     def __str__(self):
-        return ".".join(map(str, self.__components))
+        return self.__str
 
     __repr__ = __str__
 
-    @staticmethod
-    def __compare(v1: "Version", v2: "Version") -> int:
-        c1 = v1.__components
-        c2 = v2.__components
-        # Zero pad
-        if len(c1) < len(c2):
-            c1 += (0,) * (len(c2) - len(c1))
-        elif len(c2) < len(c1):
-            c2 += (0,) * (len(c1) - len(c2))
-        for c1, c2 in zip(v1.__components, v2.__components):
-            if c1 > c2:
-                return 1
-            elif c1 < c2:
-                return -1
-        return 0
-
-    def __gt__(self, other: "Version"):
-        if isinstance(other, Version):
-            return self.__compare(self, other) == 1
-        else:
-            raise TypeError(f"Expected other to have type {Version}, got {type(other)}")
-
-    def __ge__(self, other: "Version"):
-        if isinstance(other, Version):
-            return self.__compare(self, other) in [0, 1]
-        else:
-            raise TypeError(f"Expected other to have type {Version}, got {type(other)}")
-
     def __lt__(self, other: "Version"):
-        if isinstance(other, Version):
-            return self.__compare(self, other) == -1
-        else:
-            raise TypeError(f"Expected other to have type {Version}, got {type(other)}")
-
-    def __le__(self, other: "Version"):
-        if isinstance(other, Version):
-            return self.__compare(self, other) in [-1, 0]
-        else:
-            raise TypeError(f"Expected other to have type {Version}, got {type(other)}")
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.__key < other.__key
 
     def __eq__(self, other: "Version"):
-        if isinstance(other, Version):
-            return self.__compare(self, other) == 0
-        else:
-            raise TypeError(f"Expected other to have type {Version}, got {type(other)}")
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.__key == other.__key
 
-    def __ne__(self, other: "Version"):
-        if isinstance(other, Version):
-            return self.__compare(self, other) != 0
-        else:
-            raise TypeError(f"Expected other to have type {Version}, got {type(other)}")
+    def __hash__(self):
+        return hash(self.__key)
 
     @property
     def components(self):
-        return self.__components
+        return self._components
+
+    @classmethod
+    def from_str(cls, version_string: Union[str, bytes]):
+        # ASCII version strings (e.g. read from a packet) are split and parsed directly, as int accepts the digits as
+        # bytes as well, instead of decoding them first
+        separator = b"." if isinstance(version_string, bytes) else "."
+        return cls.get(*map(int, version_string.split(separator)))
 
     @classmethod
-    def from_str(cls, version_string: str):
-        return cls(*map(int, version_string.split(".")))
+    @lru_cache(maxsize=256)
+    def get(cls, *components: int) -> "Version":
+        # Returns a shared instance per distinct list of components. As versions are immutable, the few distinct
+        # versions a session deals with (e.g. the ones in every server info packet) need to be created only once.
+        return cls(*components)
 
     @classmethod
     def create(cls, major: int = 0, minor: int = 0, revision: int = 0, build: int = 0):